@@ -9,52 +9,148 @@ import sys
 import subprocess
 import json
 import argparse
+import concurrent.futures
+import functools
+import hashlib
+import mimetypes
+import re
 import time
+import urllib.error
+import urllib.request
 from pathlib import Path
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+
+# boto3/botocore are imported inside the functions that need them: the cold
+# import costs several hundred ms of botocore model loading, which partial
+# runs (--skip-build --skip-invalidation) shouldn't pay up front
+
+# Partition boundary between the wide small-file PUT pool and the narrow
+# large-file pool in sync_to_s3.
+LARGE_FILE_THRESHOLD = 16 * 1024 * 1024
+
+# Multipart uploads kick in at this size and use parts of the same size on
+# every upload path: boto3's TransferConfig is set to it explicitly, and the
+# CRT client's multipart threshold equals its part_size. The ETag emulation
+# must mirror both values exactly or unchanged files re-upload forever.
+MULTIPART_CHUNKSIZE = 32 * 1024 * 1024
+
+# Matches KEY=value lines in .env files, tolerating an optional `export`
+# prefix and surrounding whitespace; comments and malformed lines don't
+# match. Horizontal whitespace only ([^\S\n]) - under MULTILINE a plain \s
+# would run across the newline on empty-value lines and eat the next line
+_ENV_LINE_RE = re.compile(
+    r'^[^\S\n]*(?:export[^\S\n]+)?([A-Za-z_][A-Za-z0-9_]*)[^\S\n]*=[^\S\n]*(.*?)[^\S\n]*$',
+    re.MULTILINE
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_session(profile):
+    """Create the boto3 session for a profile once and reuse it
+
+    Session construction re-reads ~/.aws/config and resolves SSO tokens,
+    which is noticeably slow - every caller should go through here.
+    """
+    import boto3
+    return boto3.Session(profile_name=profile)
+
+
+@functools.lru_cache(maxsize=None)
+def get_client(service, profile):
+    """Create a service client once per (service, profile) and reuse it"""
+    from botocore.config import Config
+
+    # Per-service client configs - the S3 pool is sized for the two upload
+    # executors in sync_to_s3 plus the delete/list traffic
+    configs = {
+        's3': Config(max_pool_connections=128, retries={'mode': 'adaptive'})
+    }
+    return get_session(profile).client(service, config=configs.get(service))
 
 
 def run_command(command, cwd=None, check=True):
-    """Run shell command and return result"""
+    """Run shell command, streaming its output live, and return the result"""
     print(f"Running: {command}")
-    result = subprocess.run(
+    process = subprocess.Popen(
         command,
         shell=True,
         cwd=cwd,
-        capture_output=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         text=True,
-        check=check
+        bufsize=1
     )
 
-    if result.stdout:
-        print(result.stdout)
-    if result.stderr and result.returncode != 0:
-        print(f"ERROR: {result.stderr}")
+    # Tee child output line by line instead of buffering it all in memory -
+    # long npm builds show progress immediately this way
+    for line in process.stdout:
+        sys.stdout.write(line)
+    returncode = process.wait()
+
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
 
-    return result
+    return subprocess.CompletedProcess(command, returncode)
+
+
+# How long cached stack outputs are trusted without re-checking CloudFormation.
+# Outputs only change when CDK re-deploys the web stack, so this is generous.
+OUTPUTS_CACHE_TTL = 300  # seconds
 
 
 def get_stack_outputs(stack_name, profile=None):
-    """Get CloudFormation stack outputs"""
-    try:
-        session = boto3.Session(profile_name=profile)
-        cf_client = session.client('cloudformation')
+    """Get CloudFormation stack outputs, cached on disk between deploys"""
+    from botocore.exceptions import ClientError, NoCredentialsError, ProfileNotFound
 
-        response = cf_client.describe_stacks(StackName=stack_name)
-        outputs = {}
+    cache_file = Path('.deploy-cache') / f"{stack_name}.json"
 
-        if 'Stacks' in response and response['Stacks']:
-            stack = response['Stacks'][0]
-            if 'Outputs' in stack:
-                for output in stack['Outputs']:
-                    outputs[output['OutputKey']] = output['OutputValue']
+    try:
+        cached = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        cached = None
 
-        return outputs
-    except ClientError as e:
+    # Within the TTL, trust the cache outright and skip the API round trip
+    if cached is not None and time.time() - cached.get('fetched_at', 0) < OUTPUTS_CACHE_TTL:
+        print(f"Using cached stack outputs from {cache_file}")
+        return cached['outputs']
+
+    # Credential errors are caught here too: partial runs skip the STS
+    # preflight, so this can be the first AWS call that surfaces them
+    try:
+        cf_client = get_client('cloudformation', profile)
+        response = cf_client.describe_stacks(StackName=stack_name)
+    except (ClientError, NoCredentialsError, ProfileNotFound) as e:
         print(f"Error getting stack outputs: {e}")
+        # A stale cache still beats failing the deploy outright
+        if cached is not None:
+            print(f"Falling back to cached stack outputs from {cache_file}")
+            return cached['outputs']
         return {}
 
+    outputs = {}
+    last_updated = ''
+    if 'Stacks' in response and response['Stacks']:
+        stack = response['Stacks'][0]
+        last_updated = str(stack.get('LastUpdatedTime') or stack.get('CreationTime') or '')
+        if cached is not None and cached.get('last_updated') == last_updated:
+            # Stack untouched since the cached deploy - keep the cached copy
+            outputs = cached['outputs']
+        else:
+            for output in stack.get('Outputs', []):
+                outputs[output['OutputKey']] = output['OutputValue']
+
+    if outputs:
+        try:
+            cache_file.parent.mkdir(exist_ok=True)
+            cache_file.write_text(json.dumps({
+                'last_updated': last_updated,
+                'fetched_at': time.time(),
+                'outputs': outputs
+            }, indent=2))
+        except OSError as e:
+            print(f"WARNING: Could not write stack outputs cache: {e}")
+
+    return outputs
+
 
 def build_frontend():
     """Build the frontend application"""
@@ -73,47 +169,296 @@ def build_frontend():
     print("✓ Frontend build completed")
 
 
+def list_local_files(dist_path):
+    """Walk the build output and return {s3_key: (path, size)}
+
+    Uses os.scandir so each DirEntry carries a cached stat result - no
+    second stat() syscall per file during the diff pass.
+    """
+    local_files = {}
+
+    def walk(root):
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    walk(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    key = os.path.relpath(entry.path, dist_path).replace(os.sep, '/')
+                    local_files[key] = (entry.path, entry.stat().st_size)
+
+    walk(dist_path)
+    return local_files
+
+
+def list_remote_objects(s3_client, bucket_name):
+    """Return {key: (etag, size)} for every object currently in the bucket"""
+    remote = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name):
+        for obj in page.get('Contents', []):
+            remote[obj['Key']] = (obj['ETag'].strip('"'), obj['Size'])
+    return remote
+
+
+def guess_content_type(path):
+    """Guess the MIME type for an uploaded file"""
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def cache_control_for(key):
+    """Choose the Cache-Control header for an S3 key
+
+    index.html and the service worker must always revalidate so new deploys
+    show up immediately; Vite writes content-hashed filenames under assets/,
+    which makes those safe to cache forever.
+    """
+    filename = key.rsplit('/', 1)[-1]
+    if filename in ('index.html', 'service-worker.js'):
+        return 'no-cache, no-store, must-revalidate'
+    if key.startswith('assets/'):
+        return 'public, max-age=31536000, immutable'
+    return 'public, max-age=3600'
+
+
+def upload_extra_args(key, path):
+    """Per-file metadata applied during upload"""
+    return {
+        'ContentType': guess_content_type(path),
+        'CacheControl': cache_control_for(key)
+    }
+
+
+def create_crt_transfer_manager(session):
+    """Build a CRT-backed S3 transfer manager, or None when the CRT is unavailable
+
+    The CRT client runs the TLS/HTTP state machine on native event-loop threads
+    and splits requests automatically, so large uploads are not serialized
+    behind the Python GIL.
+    """
+    try:
+        from awscrt.s3 import S3Client  # noqa: F401 - verifies the CRT is importable
+        from s3transfer.crt import (
+            BotocoreCRTCredentialsWrapper,
+            BotocoreCRTRequestSerializer,
+            CRTTransferManager,
+            create_s3_crt_client,
+        )
+    except ImportError:
+        return None
+
+    credentials_wrapper = BotocoreCRTCredentialsWrapper(session.get_credentials())
+    crt_client = create_s3_crt_client(
+        session.region_name or 'us-west-2',
+        crt_credentials_provider=credentials_wrapper.to_crt_credentials_provider(),
+        target_throughput=10.0 * 1000 ** 3 / 8,  # 10 Gbps expressed in bytes/s
+        part_size=MULTIPART_CHUNKSIZE
+    )
+    return CRTTransferManager(crt_client, BotocoreCRTRequestSerializer(session))
+
+
+# Read size for incremental hashing - keeps memory constant regardless of
+# how large an individual bundle is
+HASH_READ_SIZE = 1024 * 1024
+
+
+def md5_part_digests(f, part_size):
+    """Yield the MD5 digest of each part_size span of an open file
+
+    Each part is hashed in HASH_READ_SIZE reads rather than loaded whole.
+    """
+    while True:
+        digest = hashlib.md5()
+        remaining = part_size
+        while remaining:
+            chunk = f.read(min(HASH_READ_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+        if remaining == part_size:  # nothing left to read
+            return
+        yield digest.digest()
+
+
+def compute_s3_etag(path, size=None):
+    """Compute the ETag S3 would report for this file
+
+    Files below MULTIPART_CHUNKSIZE are uploaded as a single PUT on every
+    path and get a plain MD5. Larger files get the multipart form
+    md5(concat(md5(part_i)))-N over MULTIPART_CHUNKSIZE parts, which
+    matches S3 because the upload paths use the same threshold and part
+    size. Hashing streams the file instead of reading it into memory at
+    once. Pass size when the caller already has it to skip the stat() call.
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size < MULTIPART_CHUNKSIZE:
+            if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+                return hashlib.file_digest(f, 'md5').hexdigest()
+            digest = hashlib.md5()
+            for chunk in iter(lambda: f.read(HASH_READ_SIZE), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
+        part_digests = list(md5_part_digests(f, MULTIPART_CHUNKSIZE))
+    combined = hashlib.md5(b''.join(part_digests)).hexdigest()
+    return f"{combined}-{len(part_digests)}"
+
+
 def sync_to_s3(bucket_name, dist_path, profile=None):
-    """Sync built files to S3 bucket"""
+    """Sync built files to S3 bucket using a shared client and parallel uploads
+
+    Returns (uploaded_keys, deleted_keys, content_hash) where content_hash is
+    a stable digest of the whole build output, suitable for idempotency keys.
+    """
     print(f"\n=== Syncing to S3: {bucket_name} ===")
 
-    # Use AWS CLI for efficient sync
-    aws_command = "aws s3 sync"
-    if profile:
-        aws_command += f" --profile {profile}"
+    # Credential errors are caught alongside API errors: on partial runs the
+    # STS preflight is skipped and get_stack_outputs may have answered from
+    # its cache, making this the first call that actually reaches AWS
+    from botocore.exceptions import ClientError, NoCredentialsError, ProfileNotFound
 
-    # Sync with proper cache headers
-    sync_cmd = f"{aws_command} {dist_path} s3://{bucket_name} --delete --exact-timestamps"
+    session = get_session(profile)
+    s3_client = get_client('s3', profile)
 
-    # Set cache control for different file types
-    result = run_command(sync_cmd)
-    if result.returncode != 0:
-        print("S3 sync failed!")
+    local_files = list_local_files(dist_path)
+    local_etags = {
+        key: compute_s3_etag(path, size=size)
+        for key, (path, size) in local_files.items()
+    }
+    try:
+        remote_objects = list_remote_objects(s3_client, bucket_name)
+    except (ClientError, NoCredentialsError, ProfileNotFound) as e:
+        print(f"S3 sync failed: {e}")
+        sys.exit(1)
+
+    # Fingerprint of the deployed content as a whole - identical builds
+    # produce identical hashes regardless of upload order
+    content_hash = hashlib.sha256(
+        '\n'.join(f"{key}:{etag}" for key, etag in sorted(local_etags.items())).encode()
+    ).hexdigest()
+
+    # Skip files whose content already matches what's in the bucket
+    to_upload = {
+        key: path for key, (path, _size) in local_files.items()
+        if remote_objects.get(key, ('', 0))[0] != local_etags[key]
+    }
+    to_delete = [key for key in remote_objects if key not in local_files]
+
+    try:
+        crt_manager = create_crt_transfer_manager(session)
+        if crt_manager is not None:
+            # Preferred path: native event loops and adaptive parallelism
+            print("Uploading via AWS CRT S3 client")
+            with crt_manager:
+                futures = [
+                    crt_manager.upload(
+                        path, bucket_name, key,
+                        extra_args=upload_extra_args(key, path)
+                    )
+                    for key, path in to_upload.items()
+                ]
+                for key, future in zip(to_upload, futures):
+                    future.result()
+                    print(f"  Uploaded: {key}")
+        else:
+            from boto3.s3.transfer import TransferConfig
+
+            # Fallback: two pools tuned to the build's bimodal file sizes.
+            # Small assets are dominated by request count, so a wide pool of
+            # single PUTs wins; the few large JS chunks get multipart uploads
+            # with big parts and their own narrow pool.
+            small_files = {
+                key: path for key, path in to_upload.items()
+                if local_files[key][1] < LARGE_FILE_THRESHOLD
+            }
+            large_files = {
+                key: path for key, path in to_upload.items()
+                if key not in small_files
+            }
+
+            transfer_config = TransferConfig(
+                multipart_threshold=MULTIPART_CHUNKSIZE,
+                multipart_chunksize=MULTIPART_CHUNKSIZE,
+                max_concurrency=8,
+                use_threads=True
+            )
+
+            def put_small(key, path):
+                with open(path, 'rb') as f:
+                    body = f.read()
+                s3_client.put_object(
+                    Bucket=bucket_name, Key=key, Body=body,
+                    **upload_extra_args(key, path)
+                )
+                return key
+
+            def upload_large(key, path):
+                s3_client.upload_file(
+                    path, bucket_name, key,
+                    ExtraArgs=upload_extra_args(key, path),
+                    Config=transfer_config
+                )
+                return key
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=64) as small_pool, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=4) as large_pool:
+                futures = [small_pool.submit(put_small, key, path) for key, path in small_files.items()]
+                futures += [large_pool.submit(upload_large, key, path) for key, path in large_files.items()]
+                for future in concurrent.futures.as_completed(futures):
+                    print(f"  Uploaded: {future.result()}")
+
+        # Remove remote files no longer present in the build (--delete behavior)
+        for i in range(0, len(to_delete), 1000):  # delete_objects API limit
+            batch = to_delete[i:i + 1000]
+            s3_client.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+            for key in batch:
+                print(f"  Deleted: {key}")
+    except (ClientError, NoCredentialsError, ProfileNotFound) as e:
+        print(f"S3 sync failed: {e}")
         sys.exit(1)
 
-    # Set no-cache for index.html
-    no_cache_cmd = f"{aws_command} s3:///{bucket_name}/index.html s3://{bucket_name}/index.html --cache-control 'no-cache, no-store, must-revalidate'"
-    run_command(no_cache_cmd, check=False)  # Don't fail if this doesn't work
+    skipped = len(local_files) - len(to_upload)
+    print(f"✓ S3 sync completed ({len(to_upload)} uploaded, {len(to_delete)} deleted, {skipped} unchanged)")
 
-    print("✓ S3 sync completed")
+    return list(to_upload), to_delete, content_hash
 
 
-def invalidate_cloudfront(distribution_id, profile=None):
+def invalidate_cloudfront(distribution_id, content_hash, changed_paths=None, profile=None):
     """Create CloudFront invalidation and return invalidation ID"""
     print(f"\n=== Invalidating CloudFront: {distribution_id} ===")
 
+    from botocore.exceptions import ClientError
+
+    # Invalidate only what changed when we know it; CloudFront charges per
+    # path beyond 1000, at which point one wildcard is the cheaper option
+    if changed_paths and len(changed_paths) <= 1000:
+        paths = sorted(changed_paths)
+    else:
+        paths = ['/*']
+
+    # Deterministic reference covering both the deployed content and the
+    # paths in this batch: an accidental re-run of the same deploy dedupes
+    # on CloudFront's side, while a rollback to previously deployed content
+    # (same content hash, different change set) still gets a fresh reference
+    caller_reference = hashlib.sha256(
+        '\n'.join([distribution_id, content_hash] + paths).encode()
+    ).hexdigest()
+
     try:
-        session = boto3.Session(profile_name=profile)
-        cf_client = session.client('cloudfront')
+        cf_client = get_client('cloudfront', profile)
 
         response = cf_client.create_invalidation(
             DistributionId=distribution_id,
             InvalidationBatch={
                 'Paths': {
-                    'Quantity': 1,
-                    'Items': ['/*']
+                    'Quantity': len(paths),
+                    'Items': paths
                 },
-                'CallerReference': str(hash(f"{distribution_id}-{os.getpid()}"))
+                'CallerReference': caller_reference
             }
         )
 
@@ -135,13 +480,14 @@ def wait_for_invalidation(distribution_id, invalidation_id, profile=None):
 
     print(f"\n=== Waiting for invalidation {invalidation_id} to complete ===")
 
+    from botocore.exceptions import ClientError
+
     max_wait_time = 300  # 5 minutes maximum
     poll_interval = 10   # 10 seconds between polls
     elapsed_time = 0
 
     try:
-        session = boto3.Session(profile_name=profile)
-        cf_client = session.client('cloudfront')
+        cf_client = get_client('cloudfront', profile)
 
         while elapsed_time < max_wait_time:
             try:
@@ -176,24 +522,25 @@ def verify_deployment(cloudfront_url):
     """Verify that the deployed site is accessible"""
     print(f"\n=== Verifying deployment at {cloudfront_url} ===")
 
+    # A HEAD request is enough to confirm reachability and skips the body
+    request = urllib.request.Request(cloudfront_url, method='HEAD')
     try:
-        import requests
-        response = requests.get(cloudfront_url, timeout=30)
-        if response.status_code == 200:
-            print("✓ Deployment verification successful - site is accessible")
-            return True
-        else:
-            print(f"WARNING: Got HTTP {response.status_code} from {cloudfront_url}")
-            return False
-    except ImportError:
-        print("WARNING: requests module not available - skipping HTTP verification")
-        print("Install requests with: pip install requests")
-        return True
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
     except Exception as e:
         print(f"WARNING: Deployment verification failed - {str(e)}")
         print("The deployment may still be successful, but the site could not be verified")
         return False
 
+    if status == 200:
+        print("✓ Deployment verification successful - site is accessible")
+        return True
+
+    print(f"WARNING: Got HTTP {status} from {cloudfront_url}")
+    return False
+
 
 def inject_environment_variables(environment):
     """Inject environment variables for build"""
@@ -209,12 +556,12 @@ def inject_environment_variables(environment):
     env_file = Path(f".env.{environment}")
     if env_file.exists():
         print(f"Loading environment from {env_file}")
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    env_vars[key] = value
+        for match in _ENV_LINE_RE.finditer(env_file.read_text()):
+            key, value = match.groups()
+            # Unwrap matching single or double quotes around the value
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+                value = value[1:-1]
+            env_vars[key] = value
 
     # Set environment variables
     for key, value in env_vars.items():
@@ -238,17 +585,22 @@ def main():
     print(f"AWS Profile: {args.profile}")
     print("")
 
-    # Verify AWS credentials
-    try:
-        session = boto3.Session(profile_name=args.profile)
-        sts = session.client('sts')
-        identity = sts.get_caller_identity()
-        print(f"AWS Account: {identity['Account']}")
-        print(f"AWS User: {identity.get('UserId', 'Unknown')}")
-        print("")
-    except (ClientError, NoCredentialsError) as e:
-        print(f"ERROR: AWS credentials not available: {e}")
-        sys.exit(1)
+    # Verify AWS credentials - skipped on partial runs so they don't pay the
+    # STS round trip; later AWS calls surface credential problems themselves
+    if args.skip_build and args.skip_invalidation:
+        print("Skipping AWS credential verification (partial run)")
+    else:
+        from botocore.exceptions import ClientError, NoCredentialsError
+
+        try:
+            sts = get_client('sts', args.profile)
+            identity = sts.get_caller_identity()
+            print(f"AWS Account: {identity['Account']}")
+            print(f"AWS User: {identity.get('UserId', 'Unknown')}")
+            print("")
+        except (ClientError, NoCredentialsError) as e:
+            print(f"ERROR: AWS credentials not available: {e}")
+            sys.exit(1)
 
     # Get stack outputs
     stack_name = f"EC2Manager-Web-{args.environment}"
@@ -289,18 +641,29 @@ def main():
         print("Run build first or use --skip-build option carefully.")
         sys.exit(1)
 
-    sync_to_s3(bucket_name, dist_path, args.profile)
+    uploaded, deleted, content_hash = sync_to_s3(bucket_name, dist_path, args.profile)
 
-    # Invalidate CloudFront
+    # Invalidate CloudFront - pointless (and billable) when the sync found
+    # nothing to upload or delete, which is common when redeploying the
+    # same artifacts
     invalidation_id = None
-    if not args.skip_invalidation:
-        invalidation_id = invalidate_cloudfront(distribution_id, args.profile)
+    invalidation_attempted = False
+    if args.skip_invalidation:
+        print("Skipping CloudFront invalidation...")
+    elif not (uploaded or deleted):
+        print("No changes, skipping CloudFront invalidation")
+    else:
+        invalidation_attempted = True
+        changed_paths = [f"/{key}" for key in uploaded] + [f"/{key}" for key in deleted]
+        # The site root is cached as its own path under the default behavior,
+        # so a new index.html must invalidate '/' as well
+        if '/index.html' in changed_paths:
+            changed_paths.append('/')
+        invalidation_id = invalidate_cloudfront(distribution_id, content_hash, changed_paths, args.profile)
 
         # Wait for invalidation to complete
         if invalidation_id:
             wait_for_invalidation(distribution_id, invalidation_id, args.profile)
-    else:
-        print("Skipping CloudFront invalidation...")
 
     # Verify deployment
     print(f"\n=== Verifying Deployment ===")
@@ -317,10 +680,14 @@ def main():
         print("✓ Site verified accessible (invalidation skipped)")
 
     print("")
-    if not args.skip_invalidation:
+    if invalidation_id:
         print("✓ CloudFront cache has been invalidated - changes should be visible immediately")
-    else:
+    elif invalidation_attempted:
+        print("WARNING: CloudFront invalidation failed - cached content may be stale until it expires")
+    elif args.skip_invalidation:
         print("Note: CloudFront cache was not invalidated - changes may take time to appear")
+    else:
+        print("Note: nothing changed in this deploy, so the CloudFront cache was left as-is")
 
 
 if __name__ == "__main__":
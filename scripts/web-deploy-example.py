@@ -8,11 +8,30 @@ import os
 import sys
 import subprocess
 import time
-import json
 import argparse
+import concurrent.futures
+import functools
+import hashlib
+import mimetypes
 import re
+import shutil
+import urllib.error
+import urllib.request
 from typing import Dict, Any, Optional, Tuple
 
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, WaiterError
+
+# Files at or above this size are uploaded via multipart; below it the S3 ETag
+# is a plain MD5 we can compare against local content.
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+# Read size for incremental hashing - keeps memory constant regardless of
+# how large an individual bundle is.
+HASH_READ_SIZE = 1024 * 1024
+
 
 class WebDeployer:
     """Handles deployment of the frontend web application to AWS."""
@@ -25,7 +44,28 @@ class WebDeployer:
         self.project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.frontend_dir = os.path.join(self.project_root, "frontend")
         self.build_output_dir = os.path.join(self.frontend_dir, "out")
-        
+        # One session shared by all clients: config/SSO credentials are
+        # resolved once and HTTPS connections stay alive between calls
+        self._session = boto3.Session(profile_name=self.profile, region_name=self.region)
+
+    @functools.cached_property
+    def cfn(self):
+        """Lazily created, long-lived CloudFormation client."""
+        return self._session.client("cloudformation")
+
+    @functools.cached_property
+    def s3(self):
+        """Lazily created, long-lived S3 client."""
+        return self._session.client("s3", config=Config(
+            max_pool_connections=64,
+            retries={"mode": "adaptive"}
+        ))
+
+    @functools.cached_property
+    def cf(self):
+        """Lazily created, long-lived CloudFront client."""
+        return self._session.client("cloudfront")
+
     def log(self, message: str, level: str = "INFO") -> None:
         """Log a message with timestamp and level."""
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -59,15 +99,29 @@ class WebDeployer:
         """Validate that required tools are available."""
         self.log("Validating prerequisites...")
         
-        # Check for required commands
-        required_commands = ["aws", "npm"]
-        for cmd in required_commands:
+        # Check for required commands - PATH lookup first (no fork), then probe
+        # the survivors concurrently instead of paying one process spawn each.
+        # Only npm is needed now that all AWS calls go through boto3 clients.
+        required_commands = ["npm"]
+        missing = [cmd for cmd in required_commands if shutil.which(cmd) is None]
+
+        def probe(cmd: str) -> Optional[str]:
             try:
                 subprocess.run([cmd, "--version"], capture_output=True, check=True)
+                return None
             except (subprocess.CalledProcessError, FileNotFoundError):
+                return cmd
+
+        present = [cmd for cmd in required_commands if cmd not in missing]
+        if present:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(present)) as executor:
+                missing.extend(cmd for cmd in executor.map(probe, present) if cmd)
+
+        if missing:
+            for cmd in missing:
                 self.log(f"Required command '{cmd}' not found. Please install it.", "ERROR")
-                sys.exit(1)
-                
+            sys.exit(1)
+
         # Check for frontend directory
         if not os.path.exists(self.frontend_dir):
             self.log(f"Frontend directory not found: {self.frontend_dir}", "ERROR")
@@ -85,23 +139,14 @@ class WebDeployer:
         """Get CDK stack outputs for S3 bucket and CloudFront distribution."""
         self.log(f"Getting stack outputs for {self.stack_name}...")
         
-        cmd = [
-            "aws", "cloudformation", "describe-stacks",
-            "--stack-name", self.stack_name,
-            "--query", "Stacks[0].Outputs",
-            "--output", "json",
-            "--profile", self.profile,
-            "--region", self.region
-        ]
-        
         try:
-            result = self.run_command(cmd, capture_output=True)
-            outputs_list = json.loads(result.stdout)
-        except subprocess.CalledProcessError:
+            response = self.cfn.describe_stacks(StackName=self.stack_name)
+        except ClientError:
             self.log(f"Failed to get stack outputs for {self.stack_name}. Make sure the stack is deployed.", "ERROR")
             sys.exit(1)
-            
+
         # Convert to dictionary
+        outputs_list = response["Stacks"][0].get("Outputs", [])
         outputs = {output["OutputKey"]: output["OutputValue"] for output in outputs_list}
         
         # Log available outputs for debugging
@@ -114,22 +159,16 @@ class WebDeployer:
     def verify_bucket_exists(self, bucket_name: str) -> None:
         """Verify that the S3 bucket exists and is accessible."""
         self.log(f"Verifying bucket exists: {bucket_name}")
-        
-        cmd = [
-            "aws", "s3", "ls", f"s3://{bucket_name}/",
-            "--profile", self.profile,
-            "--region", self.region
-        ]
-        
+
         try:
-            self.run_command(cmd, capture_output=True)
+            self.s3.head_bucket(Bucket=bucket_name)
             self.log(f"Bucket verified: {bucket_name}")
-        except subprocess.CalledProcessError:
+        except ClientError:
             self.log(f"Bucket does not exist or is not accessible: {bucket_name}", "ERROR")
             sys.exit(1)
         
-    def extract_deployment_info(self, outputs: Dict[str, str]) -> Tuple[str, str]:
-        """Extract S3 bucket name and CloudFront domain from stack outputs."""
+    def extract_deployment_info(self, outputs: Dict[str, str]) -> Tuple[str, str, Optional[str]]:
+        """Extract S3 bucket name, CloudFront domain and distribution ID from stack outputs."""
         self.log("Extracting deployment information from stack outputs...")
         
         # Look for frontend bucket output
@@ -160,118 +199,264 @@ class WebDeployer:
             self.log("CloudFront domain name not found in stack outputs", "ERROR")
             self.log("Expected output key containing 'DistributionDomainName'", "ERROR")
             sys.exit(1)
-            
+
+        # The CDK stack also exports the distribution ID; reading it here
+        # avoids the O(N) list_distributions scan in get_distribution_id
+        distribution_id = None
+        for key, value in outputs.items():
+            if "DistributionId" in key:
+                distribution_id = value
+                break
+
         self.log(f"Found S3 bucket: {frontend_bucket}")
         self.log(f"Found CloudFront domain: {cloudfront_domain}")
-        
-        return frontend_bucket, cloudfront_domain
-        
+        if distribution_id:
+            self.log(f"Found CloudFront distribution ID: {distribution_id}")
+
+        return frontend_bucket, cloudfront_domain, distribution_id
+        
+    def _build_output_has_files(self) -> bool:
+        """Cheaply check whether the build output directory has any entries."""
+        if not os.path.isdir(self.build_output_dir):
+            return False
+        # scandir stops at the first entry instead of materializing the
+        # whole listing the way os.listdir does
+        with os.scandir(self.build_output_dir) as entries:
+            return next(entries, None) is not None
+
     def build_frontend(self) -> None:
         """Build the Next.js frontend application."""
         self.log("Building frontend application...")
-        
+
         # Check if build output already exists and has files
-        if os.path.exists(self.build_output_dir):
-            build_files = os.listdir(self.build_output_dir)
-            if build_files:
-                self.log(f"Build output already exists with {len(build_files)} files. Skipping build.")
-                self.log(f"Using existing build output in: {self.build_output_dir}")
-                return
-        
-        # Run npm install first to ensure dependencies are up to date
-        self.log("Installing dependencies...")
-        self.run_command(["npm", "ci"], cwd=self.frontend_dir)
-        
+        if self._build_output_has_files():
+            self.log("Build output already exists. Skipping build.")
+            self.log(f"Using existing build output in: {self.build_output_dir}")
+            return
+
+        # Skip the npm ci reinstall when the lockfile is unchanged since the
+        # last successful install (same idea as the build-output check above)
+        lockfile_path = os.path.join(self.frontend_dir, "package-lock.json")
+        marker_path = os.path.join(self.frontend_dir, "node_modules", ".deploy-lock-hash")
+        lock_hash = None
+        if os.path.exists(lockfile_path):
+            with open(lockfile_path, "rb") as f:
+                lock_hash = hashlib.sha256(f.read()).hexdigest()
+
+        installed_hash = None
+        if lock_hash is not None and os.path.exists(marker_path):
+            with open(marker_path) as f:
+                installed_hash = f.read().strip()
+
+        if lock_hash is not None and lock_hash == installed_hash:
+            self.log("Dependencies unchanged (lockfile hash matches). Skipping npm ci.")
+        else:
+            self.log("Installing dependencies...")
+            self.run_command(["npm", "ci"], cwd=self.frontend_dir)
+            if lock_hash is not None:
+                with open(marker_path, "w") as f:
+                    f.write(lock_hash)
+
         # Run the build
         self.log("Building application...")
         try:
             self.run_command(["npm", "run", "build"], cwd=self.frontend_dir)
         except SystemExit:
             # Build failed, check if we have any build output we can use
-            if os.path.exists(self.build_output_dir):
-                build_files = os.listdir(self.build_output_dir)
-                if build_files:
-                    self.log("Build failed, but found existing build output. Continuing with existing files.", "WARNING")
-                    return
+            if self._build_output_has_files():
+                self.log("Build failed, but found existing build output. Continuing with existing files.", "WARNING")
+                return
             # No build output available, cannot continue
             self.log("Build failed and no existing build output found. Cannot deploy.", "ERROR")
             sys.exit(1)
-        
-        # Verify build output exists
-        if not os.path.exists(self.build_output_dir):
-            self.log(f"Build output directory not found: {self.build_output_dir}", "ERROR")
-            sys.exit(1)
-            
-        # Check if build output has files
-        build_files = os.listdir(self.build_output_dir)
-        if not build_files:
-            self.log(f"Build output directory is empty: {self.build_output_dir}", "ERROR")
+
+        # Verify build output exists and has files
+        if not self._build_output_has_files():
+            self.log(f"Build output directory is missing or empty: {self.build_output_dir}", "ERROR")
             sys.exit(1)
-            
+
         self.log(f"Frontend build completed successfully. Output in: {self.build_output_dir}")
         
-    def sync_to_s3(self, bucket_name: str) -> None:
-        """Sync built files to S3 bucket."""
+    def _list_local_files(self) -> Dict[str, Tuple[str, int]]:
+        """Walk the build output and return {s3_key: (path, size)}.
+
+        Uses os.scandir so each DirEntry carries a cached stat result - no
+        second stat() syscall per file during the diff pass.
+        """
+        local_files = {}
+
+        def walk(root: str) -> None:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        walk(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        key = os.path.relpath(entry.path, self.build_output_dir).replace(os.sep, "/")
+                        local_files[key] = (entry.path, entry.stat().st_size)
+
+        walk(self.build_output_dir)
+        return local_files
+
+    def _list_remote_objects(self, s3_client, bucket_name: str) -> Dict[str, Tuple[str, int]]:
+        """Return {key: (etag, size)} for every object currently in the bucket."""
+        remote = {}
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name):
+            for obj in page.get("Contents", []):
+                remote[obj["Key"]] = (obj["ETag"].strip('"'), obj["Size"])
+        return remote
+
+    def _md5_part_digests(self, f, part_size: int):
+        """Yield the MD5 digest of each part_size span of an open file.
+
+        Each part is hashed in HASH_READ_SIZE reads rather than loaded whole.
+        """
+        while True:
+            digest = hashlib.md5()
+            remaining = part_size
+            while remaining:
+                chunk = f.read(min(HASH_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            if remaining == part_size:  # nothing left to read
+                return
+            yield digest.digest()
+
+    def _compute_s3_etag(self, path: str, chunk_size: int = MULTIPART_THRESHOLD,
+                         size: Optional[int] = None) -> str:
+        """Compute the ETag S3 would report for this file.
+
+        Files below the multipart threshold get a plain MD5. Larger files get
+        the multipart form md5(concat(md5(part_i)))-N, which matches S3 as
+        long as the upload uses the same part size we do. Hashing streams the
+        file instead of reading it into memory at once. Pass size when the
+        caller already has it to skip the stat() call.
+        """
+        if size is None:
+            size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if size < chunk_size:
+                if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                    return hashlib.file_digest(f, "md5").hexdigest()
+                digest = hashlib.md5()
+                for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                    digest.update(chunk)
+                return digest.hexdigest()
+            part_digests = list(self._md5_part_digests(f, chunk_size))
+        combined = hashlib.md5(b"".join(part_digests)).hexdigest()
+        return f"{combined}-{len(part_digests)}"
+
+    def _file_is_unchanged(self, local_path: str, local_size: int,
+                           remote_entry: Tuple[str, int]) -> bool:
+        """Compare a local file against its remote (etag, size) entry."""
+        etag, remote_size = remote_entry
+        if local_size != remote_size:
+            return False
+        return self._compute_s3_etag(local_path, size=local_size) == etag
+
+    def sync_to_s3(self, bucket_name: str) -> bool:
+        """Sync built files to S3 bucket using a shared client and parallel uploads.
+
+        Returns True when anything was uploaded or deleted.
+        """
         self.log(f"Syncing files to S3 bucket: {bucket_name}")
-        
-        cmd = [
-            "aws", "s3", "sync",
-            self.build_output_dir + "/",  # Source directory with trailing slash
-            f"s3://{bucket_name}/",       # Destination with trailing slash
-            "--delete",                   # Remove files not present in source
-            "--profile", self.profile,
-            "--region", self.region
-        ]
-        
-        self.run_command(cmd)
-        self.log("S3 sync completed successfully")
+
+        s3_client = self.s3
+        local_files = self._list_local_files()
+        remote_objects = self._list_remote_objects(s3_client, bucket_name)
+
+        # Skip files whose content already matches what's in the bucket
+        to_upload = {
+            key: path for key, (path, size) in local_files.items()
+            if key not in remote_objects or not self._file_is_unchanged(path, size, remote_objects[key])
+        }
+        to_delete = [key for key in remote_objects if key not in local_files]
+
+        transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_THRESHOLD,
+            max_concurrency=10,
+            use_threads=True
+        )
+
+        def upload_file(key: str, path: str) -> str:
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            s3_client.upload_file(
+                path, bucket_name, key,
+                ExtraArgs={"ContentType": content_type},
+                Config=transfer_config
+            )
+            return key
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
+                futures = [executor.submit(upload_file, key, path) for key, path in to_upload.items()]
+                for future in concurrent.futures.as_completed(futures):
+                    self.log(f"Uploaded: {future.result()}")
+
+            # Remove remote files no longer present in the build (--delete behavior)
+            for i in range(0, len(to_delete), 1000):  # delete_objects API limit
+                batch = to_delete[i:i + 1000]
+                s3_client.delete_objects(
+                    Bucket=bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+                )
+                for key in batch:
+                    self.log(f"Deleted: {key}")
+        except ClientError as e:
+            self.log(f"S3 sync failed: {e}", "ERROR")
+            sys.exit(1)
+
+        skipped = len(local_files) - len(to_upload)
+        self.log(
+            f"S3 sync completed successfully "
+            f"({len(to_upload)} uploaded, {len(to_delete)} deleted, {skipped} unchanged)"
+        )
+
+        return bool(to_upload or to_delete)
         
     def get_distribution_id(self, domain_name: str) -> str:
         """Get CloudFront distribution ID from domain name."""
         self.log(f"Finding CloudFront distribution ID for domain: {domain_name}")
-        
-        cmd = [
-            "aws", "cloudfront", "list-distributions",
-            "--output", "json",
-            "--profile", self.profile
-        ]
-        
-        result = self.run_command(cmd, capture_output=True)
-        distributions = json.loads(result.stdout)
-        
+
         # Search for distribution with matching domain name
-        for dist in distributions.get("DistributionList", {}).get("Items", []):
-            if dist.get("DomainName") == domain_name:
-                dist_id = dist["Id"]
-                self.log(f"Found distribution ID: {dist_id}")
-                return dist_id
-                
-            # Also check alternate domain names
-            for alias in dist.get("Aliases", {}).get("Items", []):
-                if alias == domain_name:
+        paginator = self.cf.get_paginator("list_distributions")
+        for page in paginator.paginate():
+            for dist in page.get("DistributionList", {}).get("Items", []):
+                if dist.get("DomainName") == domain_name:
                     dist_id = dist["Id"]
-                    self.log(f"Found distribution ID for custom domain: {dist_id}")
+                    self.log(f"Found distribution ID: {dist_id}")
                     return dist_id
-                    
+
+                # Also check alternate domain names
+                for alias in dist.get("Aliases", {}).get("Items", []):
+                    if alias == domain_name:
+                        dist_id = dist["Id"]
+                        self.log(f"Found distribution ID for custom domain: {dist_id}")
+                        return dist_id
+
         self.log(f"No CloudFront distribution found for domain: {domain_name}", "ERROR")
         sys.exit(1)
         
     def create_invalidation(self, distribution_id: str) -> str:
         """Create CloudFront invalidation for all paths."""
         self.log(f"Creating CloudFront invalidation for distribution: {distribution_id}")
-        
-        cmd = [
-            "aws", "cloudfront", "create-invalidation",
-            "--distribution-id", distribution_id,
-            "--paths", "/*",
-            "--output", "json",
-            "--profile", self.profile
-        ]
-        
-        result = self.run_command(cmd, capture_output=True)
-        invalidation_data = json.loads(result.stdout)
-        
-        invalidation_id = invalidation_data["Invalidation"]["Id"]
+
+        try:
+            response = self.cf.create_invalidation(
+                DistributionId=distribution_id,
+                InvalidationBatch={
+                    "Paths": {"Quantity": 1, "Items": ["/*"]},
+                    "CallerReference": f"web-deploy-{int(time.time())}"
+                }
+            )
+        except ClientError as e:
+            self.log(f"Failed to create invalidation: {e}", "ERROR")
+            sys.exit(1)
+
+        invalidation_id = response["Invalidation"]["Id"]
         self.log(f"Invalidation created: {invalidation_id}")
         
         return invalidation_id
@@ -279,51 +464,42 @@ class WebDeployer:
     def wait_for_invalidation(self, distribution_id: str, invalidation_id: str) -> None:
         """Wait for CloudFront invalidation to complete."""
         self.log(f"Waiting for invalidation {invalidation_id} to complete...")
-        
-        max_wait_time = 300  # 5 minutes maximum
-        poll_interval = 10   # 10 seconds between polls
-        elapsed_time = 0
-        
-        while elapsed_time < max_wait_time:
-            cmd = [
-                "aws", "cloudfront", "get-invalidation",
-                "--distribution-id", distribution_id,
-                "--id", invalidation_id,
-                "--output", "json",
-                "--profile", self.profile
-            ]
-            
-            result = self.run_command(cmd, capture_output=True)
-            invalidation_data = json.loads(result.stdout)
-            
-            status = invalidation_data["Invalidation"]["Status"]
-            self.log(f"Invalidation status: {status}")
-            
-            if status == "Completed":
-                self.log("Invalidation completed successfully")
-                return
-                
-            time.sleep(poll_interval)
-            elapsed_time += poll_interval
-            
-        self.log(f"Invalidation did not complete within {max_wait_time} seconds", "ERROR")
-        sys.exit(1)
+
+        # The built-in waiter polls over one persistent connection with
+        # backoff handled by botocore (15s delay x 40 attempts = 10 minutes)
+        waiter = self.cf.get_waiter("invalidation_completed")
+        try:
+            waiter.wait(
+                DistributionId=distribution_id,
+                Id=invalidation_id,
+                WaiterConfig={"Delay": 15, "MaxAttempts": 40}
+            )
+        except WaiterError:
+            self.log("Invalidation did not complete within the wait window", "ERROR")
+            sys.exit(1)
+
+        self.log("Invalidation completed successfully")
         
     def verify_deployment(self, cloudfront_domain: str) -> None:
         """Verify that the deployed site is accessible."""
-        self.log(f"Verifying deployment at https://{cloudfront_domain}/")
-        
+        url = f"https://{cloudfront_domain}/"
+        self.log(f"Verifying deployment at {url}")
+
+        # A HEAD request is enough to confirm reachability and skips the body
+        request = urllib.request.Request(url, method="HEAD")
         try:
-            import requests
-            response = requests.get(f"https://{cloudfront_domain}/", timeout=30)
-            if response.status_code == 200:
-                self.log("Deployment verification successful - site is accessible")
-            else:
-                self.log(f"Deployment verification warning - got HTTP {response.status_code}", "WARNING")
-        except ImportError:
-            self.log("requests module not available - skipping HTTP verification", "WARNING")
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
         except Exception as e:
             self.log(f"Deployment verification warning - {str(e)}", "WARNING")
+            return
+
+        if status == 200:
+            self.log("Deployment verification successful - site is accessible")
+        else:
+            self.log(f"Deployment verification warning - got HTTP {status}", "WARNING")
             
     def deploy(self) -> None:
         """Execute the complete deployment process."""
@@ -334,25 +510,30 @@ class WebDeployer:
         
         # Step 1: Validate prerequisites
         self.validate_prerequisites()
-        
-        # Step 2: Get CDK stack outputs
-        outputs = self.get_stack_outputs()
-        
-        # Step 3: Extract deployment information
-        bucket_name, cloudfront_domain = self.extract_deployment_info(outputs)
-        
-        # Step 4: Build frontend
-        self.build_frontend()
-        
-        # Step 5: Sync to S3
-        self.sync_to_s3(bucket_name)
-        
-        # Step 6: Invalidate CloudFront cache
-        distribution_id = self.get_distribution_id(cloudfront_domain)
-        invalidation_id = self.create_invalidation(distribution_id)
-        
-        # Step 7: Wait for invalidation to complete
-        self.wait_for_invalidation(distribution_id, invalidation_id)
+
+        # Steps 2-4: the npm build does not depend on AWS state, so run it in
+        # a worker thread and do the stack-output preflight while it compiles.
+        # The AWS round trips (SSO resolution included) hide behind the build.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            build_future = executor.submit(self.build_frontend)
+            outputs = self.get_stack_outputs()
+            bucket_name, cloudfront_domain, distribution_id = self.extract_deployment_info(outputs)
+            build_future.result()
+
+        # Step 5: Sync to S3 (needs both the build output and the bucket name)
+        changed = self.sync_to_s3(bucket_name)
+
+        # Steps 6-7: Invalidate CloudFront cache and wait for it - skipped
+        # entirely when the sync changed nothing, since invalidation is both
+        # slow and billable. Falls back to the domain scan only when the
+        # stack did not export a DistributionId output.
+        if changed:
+            if not distribution_id:
+                distribution_id = self.get_distribution_id(cloudfront_domain)
+            invalidation_id = self.create_invalidation(distribution_id)
+            self.wait_for_invalidation(distribution_id, invalidation_id)
+        else:
+            self.log("No changes, skipping CloudFront invalidation")
         
         # Step 8: Verify deployment
         self.verify_deployment(cloudfront_domain)